@@ -1,22 +1,38 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Dict, Any, List
+from pydantic import BaseModel, Field
+from typing import Dict, Any, List, Optional
 from model import URLModel, ensure_model
 import os
-import json
+import orjson
+import asyncio
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 import multiprocessing
-multiprocessing.freeze_support()
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, single worker only
+    fcntl = None
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, CONTENT_TYPE_LATEST, generate_latest, multiprocess
 
 
 app = FastAPI(title="Phishing URL Detector", version="1.0.0")
 
-# 
+# Deployed frontends plus local dev servers; CORS_ORIGINS (comma-separated) overrides.
+DEFAULT_CORS_ORIGINS = [
+    "https://detectoeapp.netlify.app",
+    "https://phishing-detector-4-q04i.onrender.com",
+    "http://localhost:3000",
+    "http://localhost:5173",
+]
+CORS_ORIGINS = [o.strip() for o in os.environ.get("CORS_ORIGINS", "").split(",") if o.strip()] or DEFAULT_CORS_ORIGINS
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["https://phishing-detector-4-q04i.onrender.com", "detectoeapp.netlify.app", "*"],
+    allow_origins=CORS_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -24,16 +40,131 @@ app.add_middleware(
 
 url_model: URLModel = ensure_model()
 
+# Inference runs off the event loop on a shared pool sized to the machine.
+@app.on_event("startup")
+async def start_inference_executor():
+    app.state.executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+
+@app.on_event("shutdown")
+async def stop_inference_executor():
+    app.state.executor.shutdown(wait=True)
+
+PREDICT_CACHE_SIZE = 10_000
+
+# Results are keyed on the stripped URL and must be treated as read-only.
+@lru_cache(maxsize=PREDICT_CACHE_SIZE)
+def _cached_predict(url: str) -> Dict[str, Any]:
+    return url_model.predict_with_explain(url)
+
 METRICS_PATH = Path(__file__).parent / "metrics.json"
+METRICS_LOCK_PATH = METRICS_PATH.with_name(METRICS_PATH.name + ".lock")
+METRICS_FLUSH_INTERVAL = 5.0  # seconds between metrics.json merges
+COUNT_KEYS = ("total", "phishing", "legit")
 
-def load_metrics():
+def _read_metrics_file() -> Dict[str, Any]:
     if METRICS_PATH.exists():
-        return json.loads(METRICS_PATH.read_text())
+        return orjson.loads(METRICS_PATH.read_bytes())
+    return {"total": 0, "phishing": 0, "legit": 0, "last_updated": None}
+
+def _empty_delta() -> Dict[str, Any]:
     return {"total": 0, "phishing": 0, "legit": 0, "last_updated": None}
 
-def save_metrics(metrics: Dict[str, Any]):
-    metrics["last_updated"] = datetime.utcnow().isoformat()
-    METRICS_PATH.write_text(json.dumps(metrics, indent=2))
+# Counters live in memory; /predict never touches the disk. _pending holds this
+# worker's counts since the last flush, which adds them into metrics.json, so
+# several workers sharing the file each contribute their own counts.
+_metrics: Dict[str, Any] = _read_metrics_file()
+_pending: Dict[str, Any] = _empty_delta()
+_metrics_lock = threading.Lock()
+
+# Process-local Prometheus counters for scraping, alongside the persisted dashboard totals.
+PREDICTIONS = Counter("phishing_predictions", "URLs scored, by predicted label", ["label"])
+
+def _prometheus_registry() -> CollectorRegistry:
+    # Under several uvicorn workers, aggregate every worker's counters from PROMETHEUS_MULTIPROC_DIR.
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+def load_metrics() -> Dict[str, Any]:
+    with _metrics_lock:
+        return _metrics.copy()
+
+def record_predictions(labels: List[str]):
+    # One lock acquisition per request, however many URLs it scored.
+    if not labels:
+        return
+    phishing = sum(1 for label in labels if label == "phishing")
+    if phishing:
+        PREDICTIONS.labels("phishing").inc(phishing)
+    if len(labels) > phishing:
+        PREDICTIONS.labels("legit").inc(len(labels) - phishing)
+    now = datetime.utcnow().isoformat()
+    with _metrics_lock:
+        for counts in (_metrics, _pending):
+            counts["total"] += len(labels)
+            counts["phishing"] += phishing
+            counts["legit"] += len(labels) - phishing
+            counts["last_updated"] = now
+
+def _merge_pending_into_file(delta: Dict[str, Any]) -> Dict[str, Any]:
+    # Read-add-write under an exclusive lock so concurrent workers never drop
+    # each other's counts; returns the merged totals.
+    with open(METRICS_LOCK_PATH, "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        merged = _read_metrics_file()
+        if delta["total"]:
+            for key in COUNT_KEYS:
+                merged[key] = merged.get(key, 0) + delta[key]
+            merged["last_updated"] = max(filter(None, [merged.get("last_updated"), delta["last_updated"]]))
+            # Temp file + os.replace so a crash never leaves a half-written metrics.json.
+            tmp = METRICS_PATH.with_name(f".{METRICS_PATH.name}.{os.getpid()}.tmp")
+            try:
+                tmp.write_bytes(orjson.dumps(merged))
+                os.replace(tmp, METRICS_PATH)
+            finally:
+                tmp.unlink(missing_ok=True)  # only still there if the write or replace failed
+        return merged
+
+def save_metrics():
+    global _metrics, _pending
+    with _metrics_lock:
+        delta, _pending = _pending, _empty_delta()
+    try:
+        merged = _merge_pending_into_file(delta)
+    except (OSError, ValueError) as e:  # ValueError: unreadable metrics.json
+        with _metrics_lock:  # put the counts back; the next flush retries
+            for key in COUNT_KEYS:
+                _pending[key] += delta[key]
+            _pending["last_updated"] = _pending["last_updated"] or delta["last_updated"]
+        print("Metrics flush failed:", e)
+        return
+    # Refresh the in-memory view with every worker's flushed counts plus ours
+    # recorded since the merge, so /metrics shows the combined totals.
+    with _metrics_lock:
+        for key in COUNT_KEYS:
+            merged[key] = merged.get(key, 0) + _pending[key]
+        merged["last_updated"] = _pending["last_updated"] or merged.get("last_updated")
+        _metrics = merged
+
+async def _flush_metrics_periodically():
+    while True:
+        await asyncio.sleep(METRICS_FLUSH_INTERVAL)
+        try:
+            await asyncio.to_thread(save_metrics)  # file lock + I/O stay off the event loop
+        except Exception as e:  # keep flushing; one bad flush must not stop the task
+            print("Metrics flush failed:", e)
+
+@app.on_event("startup")
+async def start_metrics_flusher():
+    app.state.metrics_flusher = asyncio.create_task(_flush_metrics_periodically())
+
+@app.on_event("shutdown")
+async def stop_metrics_flusher():
+    app.state.metrics_flusher.cancel()
+    await asyncio.to_thread(save_metrics)
 
 class PredictIn(BaseModel):
     url: str
@@ -45,28 +176,68 @@ class PredictOut(BaseModel):
     features: Dict[str, Any]
     top_contributors: List[Dict[str, Any]]
 
-@app.get("/")
+MAX_BATCH_SIZE = 500  # keeps a single /predict_batch call from monopolising a worker
+
+class PredictBatchIn(BaseModel):
+    urls: List[str] = Field(max_length=MAX_BATCH_SIZE)
+
+class PredictBatchItem(BaseModel):
+    url: str
+    pred_label: str
+    pred_proba: float
+
+class PredictionCacheOut(BaseModel):
+    hits: int
+    misses: int
+    size: int
+    maxsize: int
+
+class MetricsOut(BaseModel):
+    total: int
+    phishing: int
+    legit: int
+    last_updated: Optional[str]
+    prediction_cache: PredictionCacheOut
+
+# Every route declares its response model and returns plain data, so FastAPI
+# validates once and serializes straight to JSON bytes through pydantic.
+@app.get("/", response_model=Dict[str, str])
 def read_root():
     return {"Hello": "World"}
 
-@app.get("/health")
+@app.get("/health", response_model=Dict[str, str])
 def health():
     return {"status": "ok"}
 
-@app.get("/metrics")
+@app.get("/metrics", response_model=MetricsOut)
 def metrics():
-    return load_metrics()
+    info = _cached_predict.cache_info()
+    return {
+        **load_metrics(),
+        "prediction_cache": {"hits": info.hits, "misses": info.misses, "size": info.currsize, "maxsize": info.maxsize},
+    }
+
+@app.get("/metrics/prometheus", response_class=Response)
+def metrics_prometheus():
+    return Response(generate_latest(_prometheus_registry()), media_type=CONTENT_TYPE_LATEST)
 
 @app.post("/predict", response_model=PredictOut)
-def predict(payload: PredictIn):
+async def predict(payload: PredictIn):
     url = payload.url.strip()
-    result = url_model.predict_with_explain(url)
-    # Update metrics
-    m = load_metrics()
-    m["total"] += 1
-    if result["pred_label"] == "phishing":
-        m["phishing"] += 1
-    else:
-        m["legit"] += 1
-    save_metrics(m)
-    return PredictOut(**result)
\ No newline at end of file
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(app.state.executor, _cached_predict, url)
+    record_predictions([result["pred_label"]])
+    return result
+
+@app.post("/predict_batch", response_model=List[PredictBatchItem])
+async def predict_batch(payload: PredictBatchIn):
+    loop = asyncio.get_running_loop()
+    results = await loop.run_in_executor(app.state.executor, url_model.predict_batch, payload.urls)
+    record_predictions([r["pred_label"] for r in results])
+    return results
+
+if __name__ == "__main__":
+    # Only needed when the server is run as a frozen executable.
+    multiprocessing.freeze_support()
+    import uvicorn
+    uvicorn.run(app, host="127.0.0.1", port=8000)
@@ -1,18 +1,16 @@
 from __future__ import annotations
-import re, math, json
-from dataclasses import dataclass
+import re, math, json, threading
+from collections import Counter
+from dataclasses import dataclass, field
 from typing import Dict, Any, List, Tuple
 from pathlib import Path
-import joblib
 import numpy as np
-import pandas as pd
 import tldextract
-from sklearn.linear_model import LogisticRegression
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import classification_report
+from numba import njit
 
 BASE = Path(__file__).parent
-MODEL_PATH = BASE / "model.pkl"
+# Only coefficients, bias and feature order; loading needs numpy alone.
+MODEL_PATH = BASE / "model.npz"
 
 SUSPICIOUS_TLDS = {
     "ru","tk","cn","ga","cf","ml","gq","work","top","xyz","link","click","country"
@@ -22,79 +20,313 @@ KEYWORDS = [
     "apple","paypal","microsoft","amazon","prize","winner","free","gift","download"
 ]
 
+# Bundled Public Suffix List snapshot only: no network fetch or disk cache on first use.
+TLDX = tldextract.TLDExtract(suffix_list_urls=(), cache_dir=None, include_psl_private_domains=False)
+
+IP_RE = re.compile(r"(?:\d{1,3}\.){3}\d{1,3}")
+# Zero-width lookahead so overlapping keywords ("paypalogin") are all seen in one pass.
+KEYWORD_RE = re.compile("(?=(" + "|".join(map(re.escape, KEYWORDS)) + "))")
+
+FEATURE_NAMES = [
+    "length","num_digits","num_specials","num_subdomains","has_ip","has_at",
+    "has_dash_in_domain","suspicious_tld","keyword_hits","host_entropy","uses_https",
+    "num_params","long_path",
+]
+SPECIAL_CHARS = "._-@?&=%"
+_DIGIT_BYTES = np.arange(ord("0"), ord("9") + 1)
+_SPECIAL_BYTES = np.frombuffer(SPECIAL_CHARS.encode(), dtype=np.uint8)
+# Deletion tables for bytes.translate: what survives is exactly the bytes we want to count.
+_NON_DIGIT_BYTES = bytes(i for i in range(256) if not ord("0") <= i <= ord("9"))
+_NON_SPECIAL_BYTES = bytes(i for i in range(256) if chr(i) not in SPECIAL_CHARS)
+_SPECIAL_LUT = np.zeros(256, dtype=np.bool_)
+_SPECIAL_LUT[_SPECIAL_BYTES] = True
+# Keywords for the fused kernel: concatenated bytes plus [start, end) offsets.
+_KW_FLAT = np.frombuffer("".join(KEYWORDS).encode(), dtype=np.uint8)
+_KW_OFFSETS = np.cumsum([0] + [len(kw) for kw in KEYWORDS]).astype(np.int64)
+
+@njit(cache=True)
+def _entropy_from_hist(hist, n):
+    s = 0.0
+    for i in range(256):
+        c = hist[i]
+        if c:
+            p = c / n
+            s -= p * math.log2(p)
+    return s
+
 def shannon_entropy(s: str) -> float:
     if not s:
         return 0.0
-    from collections import Counter
+    if s.isascii():
+        arr = np.frombuffer(s.encode("ascii"), dtype=np.uint8)
+        return float(_entropy_from_hist(np.bincount(arr, minlength=256), arr.size))
     counts = Counter(s)
     length = len(s)
     return -sum((c/length) * math.log2(c/length) for c in counts.values())
 
-def extract_features(url: str) -> Dict[str, float]:
-    url = url.strip()
-    parsed = tldextract.extract(url)
+def _domain_parts(url: str) -> Tuple[str, float, float, float]:
+    # Public Suffix List based features: (host, num_subdomains, has_dash_in_domain, suspicious_tld).
+    parsed = TLDX(url)
     domain = f"{parsed.domain}.{parsed.suffix}" if parsed.suffix else parsed.domain
     subdomain = parsed.subdomain or ""
     host = ".".join([p for p in [subdomain, domain] if p])
-    path = ""
-    try:
-        path = re.sub(r"^https?://", "", url, flags=re.I)
-    except Exception:
-        pass
+    num_sub = subdomain.count(".") + (1 if subdomain else 0)
+    has_dash = 1.0 if "-" in parsed.domain else 0.0
+    tld_susp = 1.0 if parsed.suffix.lower() in SUSPICIOUS_TLDS else 0.0
+    return host, float(num_sub), has_dash, tld_susp
+
+def _structure_features(url: str) -> Tuple[str, Dict[str, float]]:
+    # Everything except the character-count features; returns the host too.
+    host, num_sub, has_dash, tld_susp = _domain_parts(url)
 
-    has_ip = 1.0 if re.search(r"(\d{1,3}\.){3}\d{1,3}", url) else 0.0
+    url_lower = url.lower()
+    has_ip = 1.0 if IP_RE.search(url) else 0.0
     has_at = 1.0 if "@" in url else 0.0
-    has_dash = 1.0 if "-" in parsed.domain else 0.0
-    num_sub = subdomain.count(".") + (1 if subdomain else 0)
-    tld = parsed.suffix.lower()
-    tld_susp = 1.0 if tld in SUSPICIOUS_TLDS else 0.0
-    length = len(url)
-    num_digits = sum(ch.isdigit() for ch in url)
-    num_spec = sum(ch in "._-@?&=%" for ch in url)
-    keyword_hits = sum(1 for kw in KEYWORDS if kw in url.lower())
-    host_entropy = shannon_entropy(host)
-    uses_https = 1.0 if url.lower().startswith("https://") else 0.0
+    keyword_hits = len(set(KEYWORD_RE.findall(url_lower)))
+    uses_https = 1.0 if url_lower.startswith("https://") else 0.0
     num_params = url.count("=")
     long_path = 1.0 if len(url.split("/", 3)[-1]) > 60 else 0.0
 
-    feats = {
-        "length": float(length),
-        "num_digits": float(num_digits),
-        "num_specials": float(num_spec),
-        "num_subdomains": float(num_sub),
+    return host, {
+        "length": float(len(url)),
+        "num_subdomains": num_sub,
         "has_ip": has_ip,
         "has_at": has_at,
         "has_dash_in_domain": has_dash,
         "suspicious_tld": tld_susp,
         "keyword_hits": float(keyword_hits),
-        "host_entropy": float(host_entropy),
         "uses_https": uses_https,
         "num_params": float(num_params),
         "long_path": long_path,
     }
-    return feats
+
+def extract_features(url: str) -> Dict[str, float]:
+    url = url.strip()
+    host, structure = _structure_features(url)
+    b = url.encode("utf-8")
+    if url.isascii():
+        num_digits = len(b.translate(None, _NON_DIGIT_BYTES))
+    else:
+        num_digits = sum(ch.isdigit() for ch in url)  # str.isdigit also counts non-ASCII digits
+    num_spec = len(b.translate(None, _NON_SPECIAL_BYTES))
+    host_entropy = shannon_entropy(host)
+
+    feats = dict(structure)
+    feats["num_digits"] = float(num_digits)
+    feats["num_specials"] = float(num_spec)
+    feats["host_entropy"] = float(host_entropy)
+    return {name: feats[name] for name in FEATURE_NAMES}
+
+@njit(cache=True)
+def _is_digit(c):
+    return 48 <= c <= 57
+
+@njit(cache=True)
+def _has_ip(b):
+    # Same as IP_RE.search: a dot preceded by a digit, two dot-terminated runs of
+    # 1-3 digits, then at least one more digit.
+    n = b.size
+    for p in range(1, n):
+        if b[p] != 46 or not _is_digit(b[p - 1]):
+            continue
+        q = p
+        ok = True
+        for _ in range(2):
+            k = q + 1
+            while k < n and k - q <= 4 and _is_digit(b[k]):
+                k += 1
+            if k - q - 1 < 1 or k - q - 1 > 3 or k >= n or b[k] != 46:
+                ok = False
+                break
+            q = k
+        if ok and q + 1 < n and _is_digit(b[q + 1]):
+            return True
+    return False
+
+@njit(cache=True)
+def _score_ascii(b, host, num_sub, has_dash, tld_susp, special_lut, kw_flat, kw_offsets, coef, bias, out):
+    # Fused serving path for ASCII URLs: fills out (FEATURE_NAMES order) with the
+    # same values extract_features would produce and returns sigmoid(out @ coef + bias).
+    n = b.size
+    lower = np.empty(n, np.uint8)
+    digits = 0
+    specials = 0
+    params = 0
+    has_at = 0.0
+    slashes = 0
+    last_slash = -1
+    for i in range(n):
+        c = b[i]
+        lower[i] = c + 32 if 65 <= c <= 90 else c
+        if _is_digit(c):
+            digits += 1
+        if special_lut[c]:
+            specials += 1
+        if c == 61:
+            params += 1
+        elif c == 64:
+            has_at = 1.0
+        elif c == 47 and slashes < 3:
+            slashes += 1
+            last_slash = i
+
+    hits = 0
+    for k in range(kw_offsets.size - 1):
+        start = kw_offsets[k]
+        size = kw_offsets[k + 1] - start
+        for i in range(n - size + 1):
+            j = 0
+            while j < size and lower[i + j] == kw_flat[start + j]:
+                j += 1
+            if j == size:
+                hits += 1
+                break
+
+    https = 0.0
+    if n >= 8 and lower[0] == 104 and lower[1] == 116 and lower[2] == 116 and lower[3] == 112 \
+            and lower[4] == 115 and lower[5] == 58 and lower[6] == 47 and lower[7] == 47:
+        https = 1.0
+    tail = n - last_slash - 1  # len(url.split("/", 3)[-1])
+
+    hist = np.zeros(256, np.int64)
+    for i in range(host.size):
+        hist[host[i]] += 1
+    entropy = _entropy_from_hist(hist, host.size) if host.size else 0.0
+
+    out[0] = n
+    out[1] = digits
+    out[2] = specials
+    out[3] = num_sub
+    out[4] = 1.0 if _has_ip(b) else 0.0
+    out[5] = has_at
+    out[6] = has_dash
+    out[7] = tld_susp
+    out[8] = hits
+    out[9] = entropy
+    out[10] = https
+    out[11] = params
+    out[12] = 1.0 if tail > 60 else 0.0
+
+    z = bias
+    for i in range(out.size):
+        z += out[i] * coef[i]
+    if z >= 0:
+        return 1.0 / (1.0 + math.exp(-z))
+    e = math.exp(z)
+    return e / (1.0 + e)
+
+def _fused_score(url: str, coef: np.ndarray, bias: float, out: np.ndarray) -> float:
+    # url must be stripped and ASCII.
+    host, num_sub, has_dash, tld_susp = _domain_parts(url)
+    return _score_ascii(
+        np.frombuffer(url.encode("ascii"), dtype=np.uint8),
+        np.frombuffer(host.encode("ascii"), dtype=np.uint8),
+        num_sub, has_dash, tld_susp, _SPECIAL_LUT, _KW_FLAT, _KW_OFFSETS, coef, bias, out,
+    )
+
+def _byte_histograms(strings: List[str]) -> np.ndarray:
+    # (len(strings), 256) byte counts from a single bincount over all strings.
+    encoded = [s.encode("utf-8", "ignore") for s in strings]
+    lengths = np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded))
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    rows = np.repeat(np.arange(len(encoded)), lengths)
+    flat = np.bincount(rows * 256 + data, minlength=len(encoded) * 256)
+    return flat.reshape(len(encoded), 256)
+
+def _entropy_rows(hist: np.ndarray) -> np.ndarray:
+    n = hist.sum(axis=1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = hist / n
+        terms = np.where(hist > 0, p * np.log2(p), 0.0)
+    return -terms.sum(axis=1)
+
+def extract_features_batch(urls: List[str]) -> np.ndarray:
+    """Feature matrix for many URLs, columns in FEATURE_NAMES order.
+
+    Digit/special counts and host entropy come from byte histograms computed
+    for the whole batch at once; the remaining features are parsed per URL.
+    """
+    urls = [u.strip() for u in urls]
+    X = np.zeros((len(urls), len(FEATURE_NAMES)), dtype=float)
+    col = {name: i for i, name in enumerate(FEATURE_NAMES)}
+    hosts = []
+    for i, url in enumerate(urls):
+        host, structure = _structure_features(url)
+        hosts.append(host)
+        for name, val in structure.items():
+            X[i, col[name]] = val
+
+    url_hist = _byte_histograms(urls)
+    X[:, col["num_digits"]] = url_hist[:, _DIGIT_BYTES].sum(axis=1)
+    X[:, col["num_specials"]] = url_hist[:, _SPECIAL_BYTES].sum(axis=1)
+    X[:, col["host_entropy"]] = _entropy_rows(_byte_histograms(hosts))
+    # Byte counts differ from character counts for non-ASCII text.
+    for i, url in enumerate(urls):
+        if not url.isascii():
+            X[i, col["num_digits"]] = sum(ch.isdigit() for ch in url)
+    for i, host in enumerate(hosts):
+        if not host.isascii():
+            X[i, col["host_entropy"]] = shannon_entropy(host)
+    return X
+
+TOP_K = 5  # contributors returned by predict_with_explain
+
+def _sigmoid(z: float) -> float:
+    # Split on sign so math.exp never overflows.
+    if z >= 0:
+        return 1.0 / (1.0 + math.exp(-z))
+    e = math.exp(z)
+    return e / (1.0 + e)
 
 @dataclass
 class URLModel:
-    clf: Any
     feature_names: List[str]
+    coef_vec: np.ndarray = field(repr=False)
+    bias: float
+    n: int = field(init=False, repr=False)
+    fused: bool = field(init=False, repr=False)
+    _local: threading.local = field(init=False, repr=False)
+
+    def __post_init__(self):
+        # A binary LogisticRegression is sigmoid(x @ coef + b); score it directly
+        # instead of going through sklearn on every request.
+        self.coef_vec = np.asarray(self.coef_vec, dtype=np.float64)
+        self.bias = float(self.bias)
+        self.n = len(self.feature_names)
+        # The fused kernel writes features in FEATURE_NAMES order.
+        self.fused = list(self.feature_names) == FEATURE_NAMES
+        self._local = threading.local()
+
+    def _buffers(self) -> Tuple[np.ndarray, np.ndarray]:
+        # Scratch vectors reused across requests; per thread since inference runs in a pool.
+        bufs = getattr(self._local, "bufs", None)
+        if bufs is None:
+            bufs = self._local.bufs = (np.empty(self.n, np.float64), np.empty(self.n, np.float64))
+        return bufs
 
     def predict_with_explain(self, url: str) -> Dict[str, Any]:
-        feats = extract_features(url)
-        X = np.array([[feats[f] for f in self.feature_names]], dtype=float)
-        proba = float(self.clf.predict_proba(X)[0,1])
+        x, contribs = self._buffers()
+        stripped = url.strip()
+        if self.fused and stripped.isascii():
+            proba = float(_fused_score(stripped, self.coef_vec, self.bias, x))
+            feats = dict(zip(self.feature_names, x.tolist()))
+            np.multiply(x, self.coef_vec, out=contribs)
+        else:
+            feats = extract_features(url)
+            for i, f in enumerate(self.feature_names):
+                x[i] = feats[f]
+            np.multiply(x, self.coef_vec, out=contribs)
+            proba = _sigmoid(float(contribs.sum()) + self.bias)
         label = "phishing" if proba >= 0.5 else "legit"
 
-       
-        coef = self.clf.coef_[0]
-        intercept = self.clf.intercept_[0]
-        contributions = [(name, float(val*coef[i])) for i,(name,val) in enumerate(zip(self.feature_names, X[0]))]
-        
-        top = sorted(
-            [{"feature": n, "value": float(v), "logit_contribution": float(c)} for (n,c), v in zip(zip(self.feature_names, coef), X[0])],
-            key=lambda d: abs(d["logit_contribution"]),
-            reverse=True
-        )[:5]
+        k = min(TOP_K, self.n)
+        mag = -np.abs(contribs)
+        idx = np.argpartition(mag, k - 1)[:k] if k < self.n else np.arange(self.n)
+        idx = idx[np.argsort(mag[idx], kind="stable")]
+        top = [
+            {"feature": self.feature_names[i], "value": float(x[i]), "logit_contribution": float(contribs[i])}
+            for i in idx
+        ]
 
         return {
             "url": url,
@@ -104,7 +336,18 @@ class URLModel:
             "top_contributors": top
         }
 
-def load_sample_dataset() -> pd.DataFrame:
+    def predict_batch(self, urls: List[str]) -> List[Dict[str, Any]]:
+        if not urls:
+            return []
+        X = extract_features_batch(urls)
+        with np.errstate(over="ignore"):
+            probas = 1.0 / (1.0 + np.exp(-(X @ self.coef_vec + self.bias)))
+        return [
+            {"url": url.strip(), "pred_label": "phishing" if p >= 0.5 else "legit", "pred_proba": float(p)}
+            for url, p in zip(urls, probas)
+        ]
+
+def load_sample_dataset() -> List[Tuple[str, int]]:
     # Small curated demo dataset (URLs, labels 1=phish, 0=legit)
     rows = []
     legit = [
@@ -199,37 +442,37 @@ def load_sample_dataset() -> pd.DataFrame:
         "https://www.shapanye-discon.freeddns.com/",
         ]
     for u in legit:
-        rows.append({"url": u, "label": 0})
+        rows.append((u, 0))
     for u in phish:
-        rows.append({"url": u, "label": 1})
-    df = pd.DataFrame(rows)
+        rows.append((u, 1))
 
-    extras = []
     for u in phish[:10]:
-        extras.append({"url": u + "&extra=param"*5, "label": 1})
+        rows.append((u + "&extra=param"*5, 1))
     for u in legit[:10]:
-        extras.append({"url": u + "docs/" + "a"*40, "label": 0})
-    df = pd.concat([df, pd.DataFrame(extras)], ignore_index=True)
-    return df
+        rows.append((u + "docs/" + "a"*40, 0))
+    return rows
 
 def train_or_load() -> URLModel:
     if MODEL_PATH.exists():
-        clf = joblib.load(MODEL_PATH)
-        return URLModel(clf=clf, feature_names=list(extract_features("https://example.com").keys()))
-    # Training
-    df = load_sample_dataset()
-    feat_rows = []
-    for url, label in zip(df["url"], df["label"]):
+        with np.load(MODEL_PATH) as saved:
+            return URLModel(feature_names=saved["features"].tolist(), coef_vec=saved["coef"], bias=float(saved["bias"][0]))
+    # Training; scikit-learn is only needed here, never for serving a saved model.
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.model_selection import train_test_split
+    from sklearn.metrics import classification_report
+
+    rows = load_sample_dataset()
+    feature_names = list(FEATURE_NAMES)
+    X = np.empty((len(rows), len(feature_names)), dtype=np.float64)
+    y = np.empty(len(rows), dtype=np.int64)
+    for i, (url, label) in enumerate(rows):
         feats = extract_features(url)
-        feats["label"] = label
-        feat_rows.append(feats)
-    feat_df = pd.DataFrame(feat_rows)
-    X = feat_df.drop(columns=["label"]).values
-    y = feat_df["label"].values
+        X[i] = [feats[f] for f in feature_names]
+        y[i] = label
     clf = LogisticRegression(max_iter=200)
     clf.fit(X, y)
     # Save
-    joblib.dump(clf, MODEL_PATH)
+    np.savez(MODEL_PATH, coef=clf.coef_[0], bias=clf.intercept_[:1], features=np.array(feature_names))
     
     try:
         Xtr, Xte, ytr, yte = train_test_split(X, y, test_size=0.3, random_state=42, stratify=y)
@@ -238,10 +481,48 @@ def train_or_load() -> URLModel:
         print(classification_report(yte, ypred))
     except Exception as e:
         print("Eval skipped:", e)
-    return URLModel(clf=clf, feature_names=[c for c in feat_df.columns if c != "label"])
+    return URLModel(feature_names=feature_names, coef_vec=clf.coef_[0], bias=float(clf.intercept_[0]))
+
+# Inputs that exercise every hand-written scan in _score_ascii. The fused path must
+# reproduce extract_features on all of them, so served features never drift from
+# the ones the model was trained on after an edit to either side or to KEYWORDS.
+FUSED_PARITY_URLS = [
+    "", "   ", "https://example.com/", " https://www.google.com/ ",
+    # IP-like runs
+    "http://192.168.1.10/confirm/credential.php", "1.2.3.4", "1.2.3.4444.5", "1234.5.6.7",
+    "1.2345.6.7", "a1.2.3.4b", "1..2.3.4", "1.2.3.", ".1.2.3.4", "http://10.0.0.1:8080/x",
+    # overlapping / repeated / uppercase keywords
+    "http://paypalogin.com/", "http://secure-paypalogin.verify.tk/LOGIN",
+    "http://login.login.example.com/loginlogin", "https://APPLE-ID.support-Verify.com/Account",
+    # scheme variants
+    "HTTPS://WWW.PAYPAL.COM/", "HTTP://x.com", "Https://mixed.Case.org/path", "https:/one-slash.com",
+    "ftp://files.example.ru/", "httpsx://odd.example.com/",
+    # fewer than three slashes and the long-path boundary
+    "example.com", "example.com/" + "a" * 70, "a/" + "b" * 61, "http:/x", "localhost:8000/login",
+    "http://a.com/" + "d" * 60, "http://a.com/" + "d" * 61, "http://a.com/b/" + "c" * 61,
+    # specials, userinfo, params
+    "http://user@host.com/?a=1&b=%20_-", "http://bank.com.secure-update.tk/verify?id=12345&x=",
+    "https://docs.google.com/presentation/d/e/2PACX-1vTVj7OXwAUKJDv57jBmVg8eWFIUvTQ3c0-F1gPD_G5CwsQzOf3aelTqo4q42FIlqbHODnIlx2-Lx3Cf/pub?start=false&loop=false&delayms=3000",
+    "http://xn--bcher-kva.example/", "http://bücher.example/",
+]
+
+def check_fused_parity(model: URLModel) -> bool:
+    # Compare served features with extract_features; on any mismatch, serve
+    # through extract_features instead of the fused kernel.
+    for url in FUSED_PARITY_URLS:
+        served = model.predict_with_explain(url)["features"]
+        reference = extract_features(url)
+        if served != reference:
+            diff = {k: (served.get(k), reference.get(k)) for k in reference if served.get(k) != reference.get(k)}
+            print("Fused kernel disagrees with extract_features on", repr(url), diff, "- disabling it")
+            model.fused = False
+            return False
+    return True
 
 def ensure_model() -> URLModel:
-    return train_or_load()
+    model = train_or_load()
+    check_fused_parity(model)  # also compiles the numba kernels before the first request
+    return model
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
\ No newline at end of file